@@ -1,31 +1,78 @@
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-import json
+from playwright.async_api import async_playwright
+from aiohttp_client_cache import CachedSession, SQLiteBackend
+from selectolax.lexbor import LexborHTMLParser
+import aiohttp
+import asyncio
+import os
+import queue
+import orjson
+import re
+import time
 import yaml
 from pathlib import Path
-import time
-from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.traceback import install
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
 install()  # Install rich traceback handler
 console = Console()
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+DEFAULT_HEADERS = {"User-Agent": USER_AGENT}
+OUTPUT_BUFFER_SIZE = 64 * 1024
+CACHE_FILE = ".scraper-cache.sqlite"
+CACHE_EXPIRE_AFTER = 86400 * 7  # wiki pages rarely change, keep them for a week
+# Frontier entry kinds, assigned when a URL is queued
+CATEGORY = "category"
+PAGE = "page"
+CATEGORY_SELECTOR = 'div.mw-category-group'
+CATEGORY_LINK_SELECTOR = 'div.mw-category-group a[href]'
+CONTENT_SELECTOR = 'div.mw-parser-output'
+# Markup inside the content block that is not part of the article text
+NOISE_SELECTOR = 'script, style, .mw-editsection, .toc, sup.reference, .printfooter'
+BLOCKED_RESOURCES = {"image", "font", "media", "stylesheet"}
+# Serialize only the <title> and the blocks the parser reads, not the whole document
+SUBTREE_SCRIPT = """(selector) => {
+    const title = document.querySelector('title');
+    const blocks = Array.from(document.querySelectorAll(selector), (node) => node.outerHTML);
+    return (title ? title.outerHTML : '') + blocks.join('');
+}"""
+
+@lru_cache(maxsize=65536)
+def is_valid_url(url, base_pattern):
+    """Cached check that a URL has a host and falls under one of the base URLs"""
+    return bool(urlparse(url).netloc) and base_pattern.search(url) is not None
+
 class ArmaScraper:
     def __init__(self):
         self.setup_logging()
-        self.data_dir = Path("dataset/raw")
-        self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.output_file = self.data_dir / "raw_wiki_data.json"
-        self.visited_urls = set()
-        self.load_config()
-        # Initialize empty JSON file
-        with open(self.output_file, "w") as f:
-            f.write("[\n")
-        
+        try:
+            self.data_dir = Path("dataset/raw")
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            self.output_file = self.data_dir / "raw_wiki_data.jsonl"
+            # Canonical URL -> shallowest depth it has been queued at
+            self.visited_urls = {}
+            self.load_config()
+        except Exception:
+            # scrape_wiki will not run to stop the listener, flush queued records here
+            self._log_listener.stop()
+            raise
+        # Playwright is only started for URLs listed under render_urls
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._page = None
+        self._browser_failed = False
+        self._last_hit = {}
+        # HTML parsing and text extraction run here so they overlap with fetches
+        self._cpu_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    
     def setup_logging(self):
         log_dir = Path("logs")
         log_dir.mkdir(exist_ok=True)
@@ -39,95 +86,241 @@ class ArmaScraper:
         file_handler.setFormatter(
             logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         )
-        self.logger.addHandler(file_handler)
+        # Disk writes happen on the listener thread, the scraper only enqueues records
+        self._log_queue = queue.Queue(-1)
+        self.logger.addHandler(QueueHandler(self._log_queue))
+        self._log_listener = QueueListener(self._log_queue, file_handler)
+        self._log_listener.start()
     
     def load_config(self):
         try:
             with open("data-tools/scraper.yml", "r") as f:
                 self.config = yaml.safe_load(f)
+            self.base_url_pattern = re.compile(
+                '|'.join(map(re.escape, self.config['base_urls']))
+            )
+            self.render_url_prefixes = tuple(self.config['render_urls'])
             self.logger.info("Config loaded successfully")
         except Exception as e:
             self.logger.error(f"Failed to load config: {e}")
             console.print("[red bold]Failed to load config file[/]")
             raise
     
-    def is_valid_url(self, url):
-        parsed = urlparse(url)
-        return bool(parsed.netloc) and any(base in url for base in self.config['base_urls'])
+    def open_output(self):
+        """Open the JSON Lines file once for the whole run"""
+        self._out = open(self.output_file, "wb")
+        self._buf = bytearray()
     
     def append_data(self, data_item):
-        """Append a single data item to the JSON file"""
-        with open(self.output_file, "a") as f:
-            json.dump(data_item, f, indent=2)
-            f.write(",\n")  # Add comma for valid JSON array
-    
-    def finalize_json(self):
-        """Finalize the JSON file by removing the last comma and closing the array"""
-        with open(self.output_file, "rb+") as f:
-            f.seek(-2, 2)  # Go to 2nd last character
-            f.truncate()   # Remove last comma and newline
-            f.write(b"\n]")  # Close the array
-    
-    def scrape_page(self, page, url, depth=0, task_id=None, progress=None):
-        if depth > self.config['max_depth'] or url in self.visited_urls:
-            return 0  # Return count instead of data
-        
-        self.visited_urls.add(url)
+        """Append a single data item as one line, writing out every OUTPUT_BUFFER_SIZE bytes"""
+        self._buf += orjson.dumps(data_item)
+        self._buf += b"\n"
+        if len(self._buf) >= OUTPUT_BUFFER_SIZE:
+            self._out.write(self._buf)
+            self._buf.clear()
+    
+    def close_output(self):
+        """Write out what is left in the buffer and close the output file"""
+        if self._buf:
+            self._out.write(self._buf)
+            self._buf.clear()
+        self._out.close()
+    
+    async def throttle(self):
+        """Take a request token; each token is handed back rate_limit seconds later"""
+        await self._tokens.acquire()
+        asyncio.get_running_loop().call_later(self.config['rate_limit'], self._tokens.release)
+    
+    async def fetch(self, session, url):
+        """Fetch the server-rendered HTML of a page, or None on a bad status"""
+        # Cache hits never touch the wiki, so they skip the rate limit
+        if not await session.cache.has_url(url):
+            await self.throttle()
+        async with session.get(url) as response:
+            if response.status != 200:
+                console.print(f"[red]Failed to load {url} - Status: {response.status}[/]")
+                return None
+            return await response.text()
+    
+    async def render(self, url, kind):
+        """Fetch a page through Playwright for pages that need JavaScript"""
+        # A single page is reused, so browser navigations are serialized
+        async with self._browser_lock:
+            if self._page is None:
+                if self._browser_failed:
+                    console.print(f"[red]Skipping {url}, the browser failed to launch[/]")
+                    return None
+                try:
+                    await self.launch_browser()
+                except Exception:
+                    # Launch once; stop whatever did start and don't retry on every page
+                    self._browser_failed = True
+                    await self.close_browser()
+                    raise
+            
+            await self.wait_for_host(url)
+            response = await self._page.goto(url, timeout=30000, wait_until="domcontentloaded")
+            if not response.ok:
+                console.print(f"[red]Failed to render {url} - Status: {response.status}[/]")
+                return None
+            selector = CATEGORY_SELECTOR if kind == CATEGORY else CONTENT_SELECTOR
+            return await self._page.evaluate(SUBTREE_SCRIPT, selector)
+    
+    async def launch_browser(self):
+        console.print("[cyan]Launching browser for JavaScript pages...[/]")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(
+            headless=True,
+            timeout=60000,
+        )
+        self._context = await self._browser.new_context(user_agent=USER_AGENT)
+        # The scraper only reads the DOM, skip everything else
+        await self._context.route("**/*", self.prune_request)
+        self._page = await self._context.new_page()
+        self._page.set_default_timeout(30000)
+    
+    @staticmethod
+    async def prune_request(route):
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    async def wait_for_host(self, url):
+        """Sleep only for what is left of rate_limit since the last hit on this host"""
+        host = urlparse(url).netloc
+        last_hit = self._last_hit.get(host)
+        if last_hit is not None:
+            delay = self.config['rate_limit'] - (time.monotonic() - last_hit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_hit[host] = time.monotonic()
+    
+    async def close_browser(self):
+        self._context = None
+        self._page = None
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+    
+    @staticmethod
+    def canonical_url(url):
+        """Drop the fragment and lowercase the host so each page has one URL"""
+        parts = urlsplit(url)
+        return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, parts.query, ""))
+    
+    @staticmethod
+    def classify(url):
+        """Decide once, when a URL is queued, whether it is a category or a page"""
+        return CATEGORY if "Category:" in url else PAGE
+    
+    def needs_browser(self, url):
+        """Only URLs listed under render_urls are loaded through Playwright"""
+        return url.startswith(self.render_url_prefixes)
+    
+    def parse_page(self, content, url, kind):
+        """Parse a page in the CPU pool; returns (links, data_item), or None if the block is missing"""
+        tree = LexborHTMLParser(content)
+        if kind == CATEGORY:
+            return self.extract_links(tree, url)
+        return self.extract_content(tree, url)
+    
+    def extract_links(self, tree, url):
+        if tree.css_first(CATEGORY_SELECTOR) is None:
+            return None
+        links = []
+        for link in tree.css(CATEGORY_LINK_SELECTOR):
+            full_url = self.canonical_url(urljoin(url, link.attributes['href']))
+            if is_valid_url(full_url, self.base_url_pattern):
+                links.append((full_url, self.classify(full_url)))
+        return links, None
+    
+    def extract_content(self, tree, url):
+        content_div = tree.css_first(CONTENT_SELECTOR)
+        if content_div is None:
+            return None
+        for node in content_div.css(NOISE_SELECTOR):
+            node.decompose()
+        title_node = tree.css_first('title')
+        data_item = {
+            'title': title_node.text() if title_node else url,
+            'url': url,
+            'content': content_div.text().strip()
+        }
+        return [], data_item
+    
+    def enqueue(self, url, depth, kind):
+        """Queue a canonical URL at its shallowest depth seen so far; returns True if queued"""
+        if depth > self.config['max_depth']:
+            return False
+        best = self.visited_urls.get(url)
+        # Workers finish out of BFS order, so a category can turn up again closer
+        # to a start URL and needs expanding from there; pages are queued once
+        if best is not None and (kind == PAGE or best <= depth):
+            return False
+        self.visited_urls[url] = depth
+        self.frontier.put_nowait((url, depth, kind))
+        return True
+    
+    async def worker(self, session, task_id=None, progress=None):
+        """Take (url, depth, kind) entries off the frontier until cancelled"""
+        while True:
+            url, depth, kind = await self.frontier.get()
+            try:
+                # Superseded by a shallower copy queued later
+                if depth > self.visited_urls[url]:
+                    continue
+                count = await self.scrape_page(session, url, depth, kind, task_id, progress)
+                self.total_count += count
+            finally:
+                self.frontier.task_done()
+    
+    async def scrape_page(self, session, url, depth=0, kind=PAGE, task_id=None, progress=None):
         self.logger.info(f"Scraping: {url} (depth: {depth})")
         if progress and task_id:
             progress.update(task_id, description=f"Scraping: {url}")
         
         try:
             console.print(f"[yellow]Attempting to load:[/] {url}")
-            response = page.goto(url, timeout=30000, wait_until="networkidle")
-            
-            if not response.ok:
-                console.print(f"[red]Failed to load {url} - Status: {response.status}[/]")
+            if self.needs_browser(url):
+                content = await self.render(url, kind)
+            else:
+                content = await self.fetch(session, url)
+            if content is None:
                 return 0
             
-            time.sleep(self.config['rate_limit'])
-            content = page.content()
-            soup = BeautifulSoup(content, 'html.parser')
+            loop = asyncio.get_running_loop()
+            parsed = await loop.run_in_executor(self._cpu_pool, self.parse_page, content, url, kind)
+            if parsed is None:
+                self.logger.info(f"No content block found, skipping: {url}")
+                return 0
             
+            links, data_item = parsed
             count = 0
             
-            # Handle category pages differently
-            if "Category:" in url:
+            if kind == CATEGORY:
                 console.print("[cyan]Processing category page...[/]")
-                category_links = soup.find_all('div', {'class': 'mw-category-group'})
-                for group in category_links:
-                    links = group.find_all('a')
-                    for link in links:
-                        href = link.get('href')
-                        if href:
-                            full_url = urljoin(url, href)
-                            if self.is_valid_url(full_url) and full_url not in self.visited_urls:
-                                console.print(f"[blue]Found command link:[/] {full_url}")
-                                count += self.scrape_page(page, full_url, depth + 1, task_id, progress)
-            else:
-                # Handle regular command pages
-                content_div = soup.find('div', {'class': 'mw-parser-output'})
-                if content_div:
-                    title = soup.title.text if soup.title else url
-                    console.print(f"[green]Found content for:[/] {title}")
-                    data_item = {
-                        'title': title,
-                        'url': url,
-                        'content': content_div.text.strip()
-                    }
-                    self.append_data(data_item)
-                    count += 1
-                    if progress and task_id:
-                        progress.advance(task_id)
+                for full_url, link_kind in links:
+                    if self.enqueue(full_url, depth + 1, link_kind):
+                        console.print(f"[blue]Found command link:[/] {full_url}")
+            elif data_item:
+                console.print(f"[green]Found content for:[/] {data_item['title']}")
+                self.append_data(data_item)
+                count += 1
+                if progress and task_id:
+                    progress.advance(task_id)
             
             return count
-            
+        
         except Exception as e:
             self.logger.error(f"Error scraping {url}: {str(e)}")
             console.print(f"[red]Error scraping {url}:[/] {str(e)}")
             return 0
-
-    def scrape_wiki(self):
+    
+    async def scrape_wiki(self):
         try:
             with Progress(
                 SpinnerColumn(),
@@ -136,42 +329,59 @@ class ArmaScraper:
             ) as progress:
                 task_id = progress.add_task("Starting scraper...", total=None)
                 
-                with sync_playwright() as p:
-                    browser = p.chromium.launch(
-                        headless=True,
-                        timeout=60000,
-                    )
-                    
-                    context = browser.new_context(
-                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    )
-                    
-                    page = context.new_page()
-                    page.set_default_timeout(30000)
-                    
-                    console.print("[cyan]Browser launched, starting scraping...[/]")
-                    
-                    total_count = 0
-                    for url in self.config['start_urls']:
-                        console.print(f"\n[yellow]Processing start URL:[/] {url}")
-                        count = self.scrape_page(page, url, task_id=task_id, progress=progress)
-                        total_count += count
-                        console.print(f"[cyan]Found {count} entries from {url}[/]")
-                    
-                    browser.close()
-                    
-                    # Finalize JSON file
-                    self.finalize_json()
+                concurrency = self.config['concurrency']
+                self._tokens = asyncio.Semaphore(concurrency)
+                self._browser_lock = asyncio.Lock()
+                self.frontier = asyncio.Queue()
+                self.total_count = 0
+                for url in self.config['start_urls']:
+                    console.print(f"[yellow]Queued start URL:[/] {url}")
+                    self.enqueue(self.canonical_url(url), 0, self.classify(url))
+                
+                self.open_output()
+                # One keep-alive pool per run, capped per host and with cached DNS
+                connector = aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=8,
+                    keepalive_timeout=30,
+                    ttl_dns_cache=300,
+                    enable_cleanup_closed=True,
+                )
+                cache = SQLiteBackend(CACHE_FILE, expire_after=CACHE_EXPIRE_AFTER)
+                async with CachedSession(
+                    cache=cache,
+                    connector=connector,
+                    headers=DEFAULT_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=30),
+                ) as session:
+                    await session.cache.delete_expired_responses()
+                    console.print("[cyan]Session opened, starting scraping...[/]")
                     
-                progress.update(task_id, description="[green]Scraping completed!")
-                console.print(f"\n[green]Successfully saved {total_count} entries to {self.output_file}[/]")
-                self.logger.info(f"Scraping completed. Processed {total_count} pages")
+                    workers = [
+                        asyncio.create_task(self.worker(session, task_id, progress))
+                        for _ in range(concurrency)
+                    ]
+                    try:
+                        await self.frontier.join()
+                    finally:
+                        for task in workers:
+                            task.cancel()
+                        await asyncio.gather(*workers, return_exceptions=True)
+                        await self.close_browser()
+                        self._cpu_pool.shutdown()
+                        self.close_output()
                 
+                progress.update(task_id, description="[green]Scraping completed!")
+                console.print(f"\n[green]Successfully saved {self.total_count} entries to {self.output_file}[/]")
+                self.logger.info(f"Scraping completed. Processed {self.total_count} pages")
+        
         except Exception as e:
             self.logger.critical(f"Fatal error during scraping: {str(e)}")
             console.print_exception()
             raise
+        finally:
+            self._log_listener.stop()
 
 if __name__ == "__main__":
     scraper = ArmaScraper()
-    scraper.scrape_wiki() 
\ No newline at end of file
+    asyncio.run(scraper.scrape_wiki())
\ No newline at end of file
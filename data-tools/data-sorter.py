@@ -1,4 +1,7 @@
-import json
+import mmap
+import multiprocessing as mp
+import orjson
+import os
 from pathlib import Path
 import pandas as pd
 from rich.console import Console
@@ -10,6 +13,62 @@ from datetime import datetime
 install()
 console = Console()
 
+INSTRUCTION_PREFIX = "Explain the Arma command: "
+# One shared object for the empty input field of every record
+_EMPTY = ""
+# Records per task handed to a worker process
+CHUNK_SIZE = 512
+
+def iter_chunks(mm, size):
+    """Yield lists of up to size raw JSON lines from the memory-mapped input"""
+    chunk = []
+    for line in iter(mm.readline, b""):
+        if not line.strip():
+            continue
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def transform_chunk(lines):
+    """Turn one chunk of raw entries into JSON Lines plus counts for logging; runs in a worker process"""
+    records = []
+    invalid = 0
+    # Parse line by line so one truncated or corrupt entry only drops itself
+    for line in lines:
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            invalid += 1
+            continue
+        if not isinstance(record, dict):
+            invalid += 1
+            continue
+        records.append(record)
+    df = pd.DataFrame(records, columns=['title', 'url', 'content'])
+    total = len(lines)
+    # Absent or non-string fields both count as missing
+    is_text = df[['title', 'content']].map(lambda v: isinstance(v, str)).all(axis=1)
+    missing = ~is_text
+    df = df[~missing]
+    if df.empty:
+        return "", total, int(missing.sum()), invalid, []
+    
+    content = df['content'].str.strip()
+    empty = content == ""
+    empty_titles = df.loc[empty, 'title'].tolist()
+    df = df[~empty]
+    
+    processed = pd.DataFrame({
+        'instruction': INSTRUCTION_PREFIX + df['title'],
+        'input': _EMPTY,
+        'output': content[~empty]
+    })
+    json_lines = processed.to_json(orient='records', lines=True, force_ascii=False) if len(processed) else ""
+    return json_lines, total, int(missing.sum()), invalid, empty_titles
+
 class DataSorter:
     def __init__(self):
         self.setup_logging()
@@ -34,44 +93,46 @@ class DataSorter:
     
     def process_wiki_data(self):
         try:
-            input_file = self.raw_dir / "raw_wiki_data.json"
+            input_file = self.raw_dir / "raw_wiki_data.jsonl"
             if not input_file.exists():
                 raise FileNotFoundError(f"Input file not found: {input_file}")
             
-            with open(input_file, "r") as f:
-                data = json.load(f)
-            
-            self.logger.info(f"Processing {len(data)} entries")
-            console.print(f"[cyan]Processing {len(data)} entries...[/]")
-            
-            processed_data = []
-            for entry in track(data, description="Processing entries"):
-                try:
-                    content = entry['content'].strip()
-                    if not content:
-                        self.logger.warning(f"Empty content for entry: {entry['title']}")
-                        continue
-                        
-                    processed_data.append({
-                        'instruction': f"Explain the Arma command: {entry['title']}",
-                        'input': "",
-                        'output': content
-                    })
-                    
-                except KeyError as e:
-                    self.logger.error(f"Missing key in entry: {e}")
-                    console.print(f"[yellow]Skipping entry due to missing {e}[/]")
-                except Exception as e:
-                    self.logger.error(f"Error processing entry {entry.get('title', 'unknown')}: {e}")
-                    console.print(f"[red]Error processing entry:[/] {str(e)}")
+            console.print(f"[cyan]Processing entries from {input_file}...[/]")
             
             output_file = self.processed_dir / "arma_commands.jsonl"
-            with open(output_file, "w") as f:
-                for item in processed_data:
-                    f.write(json.dumps(item) + "\n")
+            total = 0
+            written = 0
+            missing = 0
+            invalid = 0
+            if input_file.stat().st_size == 0:
+                # mmap cannot map an empty file, e.g. after a scrape that found no pages
+                self.logger.warning(f"Input file is empty: {input_file}")
+                output_file.write_text("", encoding="utf-8")
+            else:
+                with open(input_file, "rb") as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                        mp.Pool(processes=os.cpu_count()) as pool, \
+                        open(output_file, "w", encoding="utf-8") as out:
+                    chunks = iter_chunks(mm, CHUNK_SIZE)
+                    # imap keeps chunks in input order so the output is reproducible
+                    results = pool.imap(transform_chunk, chunks)
+                    for json_lines, chunk_total, chunk_missing, chunk_invalid, empty_titles in track(results, description="Processing entries"):
+                        out.write(json_lines)
+                        total += chunk_total
+                        missing += chunk_missing
+                        invalid += chunk_invalid
+                        written += chunk_total - chunk_missing - chunk_invalid - len(empty_titles)
+                        for title in empty_titles:
+                            self.logger.warning(f"Empty content for entry: {title}")
             
-            self.logger.info(f"Successfully processed {len(processed_data)} entries")
-            console.print(f"[green]Successfully saved {len(processed_data)} entries to {output_file}[/]")
+            if missing:
+                self.logger.error(f"Missing or non-string title or content in {missing} entries")
+                console.print(f"[yellow]Skipped {missing} entries with missing fields[/]")
+            if invalid:
+                self.logger.error(f"Invalid JSON in {invalid} entries")
+                console.print(f"[yellow]Skipped {invalid} entries with invalid JSON[/]")
+            self.logger.info(f"Successfully processed {written} of {total} entries")
+            console.print(f"[green]Successfully saved {written} entries to {output_file}[/]")
             
         except Exception as e:
             self.logger.critical(f"Fatal error during processing: {str(e)}")